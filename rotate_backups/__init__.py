@@ -16,7 +16,9 @@ The :mod:`rotate_backups` module contains the Python API of the
 import collections
 import datetime
 import fnmatch
+import heapq
 import numbers
+import operator
 import os
 import re
 import shlex
@@ -25,7 +27,8 @@ import shlex
 from dateutil.relativedelta import relativedelta
 from executor import ExternalCommandFailed
 from executor.concurrent import CommandPool
-from executor.contexts import RemoteContext, create_context
+from executor.contexts import LocalContext, RemoteContext, create_context
+from executor.ssh.client import SSH_PROGRAM_NAME
 from humanfriendly import Timer, coerce_boolean, coerce_pattern, format_path, parse_path
 from humanfriendly.text import concatenate, pluralize, split
 from natsort import natsort
@@ -52,6 +55,31 @@ logger = VerboseLogger(__name__)
 DEFAULT_REMOVAL_COMMAND = ['rm', '-fR']
 """The default removal command (a list of strings)."""
 
+REMOVAL_BATCH_SIZE = 100
+"""
+The maximum number of backups removed by a single invocation of
+:data:`DEFAULT_REMOVAL_COMMAND` (an integer).
+"""
+
+SSH_CONTROL_DIRECTORY = '~/.cache/rotate-backups'
+"""The directory where SSH connection sharing sockets are created (a string)."""
+
+SSH_MULTIPLEXING_OPTIONS = [
+    '-o', 'ControlMaster=auto',
+    '-o', 'ControlPath=%s/cm-%%C' % SSH_CONTROL_DIRECTORY,
+    '-o', 'ControlPersist=60',
+]
+"""
+SSH client options that enable connection sharing (a list of strings).
+
+These options make all SSH commands run for the same remote location reuse a
+single (persistent) connection instead of paying for a new handshake on every
+command. Connection sharing is opt-in because these options override any
+``Control*`` settings in the user's SSH configuration. The socket names use
+the ``%C`` token (a hash of the connection details, available since OpenSSH
+6.7) so that they stay within the length limit of UNIX socket pathnames.
+"""
+
 ORDERED_FREQUENCIES = (
     ('minutely', relativedelta(minutes=1)),
     ('hourly', relativedelta(hours=1)),
@@ -102,22 +130,124 @@ TIMESTAMP_PATTERN = re.compile(r'''
         (?P<minute>\d{2}) \D?
         (?P<second>\d{2})?
     )?
-''', re.VERBOSE)
+''', re.VERBOSE | getattr(re, 'ASCII', 0))
 """
 A compiled regular expression object used to match timestamps encoded in
 filenames.
+
+The pattern is compiled with :data:`re.ASCII` (on Python 3) so that ``\\d``
+and ``\\D`` only consider the ASCII digits that timestamps in filenames are
+made of, which avoids Unicode character class lookups for every character
+of every directory entry that is scanned.
+"""
+
+CONFIG_FILE_CACHE = {}
+"""
+A dictionary with the configuration file sections parsed by
+:func:`load_config_sections()`. The keys are tuples with the absolute pathnames
+of the loaded configuration files and the values are tuples with the
+signatures of those files (see :func:`get_file_signature()`) and the parsed
+sections. Changes to configuration files invalidate (and replace) the cached
+sections, so only the latest version of each set of files is kept. Only the
+section names and option values are cached, :class:`Location` objects and
+the dictionaries derived from the options are created anew for every caller.
 """
 
+RETENTION_PERIOD_CACHE = {}
+"""
+A dictionary with retention period expressions (strings) as keys and the
+results of :func:`coerce_retention_period()` as values. Retention periods
+come from a small vocabulary (e.g. '7' or 'always') that's repeated across
+configuration file sections, so each expression is only evaluated once.
+"""
+
+
+def compile_filename_pattern(value):
+    """
+    Compile a filename pattern to a regular expression.
+
+    :param value: A shell pattern as accepted by :mod:`fnmatch` (a string) or
+                  a compiled regular expression object (which is returned
+                  unchanged).
+    :returns: A compiled regular expression object.
+
+    Like :func:`fnmatch.fnmatch()` the pattern is case insensitive on
+    platforms where :func:`os.path.normcase()` ignores case (Windows).
+    """
+    if isinstance(value, string_types):
+        flags = re.IGNORECASE if os.path.normcase('A') == 'a' else 0
+        value = re.compile(fnmatch.translate(value), flags)
+    return value
+
+
+def compile_filename_patterns(values):
+    """
+    Combine filename patterns into a single matching function.
+
+    :param values: A list of values accepted by :func:`compile_filename_pattern()`.
+    :returns: A function that takes a filename and returns a match object when
+              the filename matches any of the patterns (or :data:`None` when
+              `values` is empty).
+
+    When possible the patterns are joined into one regular expression, so that
+    each filename is matched by a single call into the regular expression
+    engine instead of one call per pattern.
+    """
+    patterns = [compile_filename_pattern(v) for v in values]
+    if not patterns:
+        return None
+    if len(patterns) == 1:
+        return patterns[0].match
+    if len(set(p.flags for p in patterns)) == 1:
+        try:
+            return re.compile('|'.join('(?:%s)' % p.pattern for p in patterns), patterns[0].flags).match
+        except re.error:
+            # Patterns with global inline flags can't be joined.
+            pass
+
+    def match_any(filename):
+        for pattern in patterns:
+            match = pattern.match(filename)
+            if match:
+                return match
+    return match_any
+
+
+def get_multiplexing_command():
+    """
+    Get an SSH client command that shares connections.
+
+    :returns: A list of strings with a command line that creates
+              :data:`SSH_CONTROL_DIRECTORY` (when it doesn't exist yet) and
+              then runs the SSH client program with
+              :data:`SSH_MULTIPLEXING_OPTIONS`.
+
+    The control directory is created by the command itself, so that it is
+    only created once a remote command actually runs (and not as a side
+    effect of parsing a location). When the directory can't be created the
+    command exits with status 255, which is how the SSH client program
+    reports connection failures.
+    """
+    return [
+        'sh', '-c', '[ -d "$1" ] || mkdir -p -m 700 "$1" || exit 255; shift; exec "$@"',
+        'rotate-backups', os.path.expanduser(SSH_CONTROL_DIRECTORY), SSH_PROGRAM_NAME,
+    ] + SSH_MULTIPLEXING_OPTIONS
+
 
 def coerce_location(value, **options):
     """
     Coerce a string to a :class:`Location` object.
 
     :param value: The value to coerce (a string or :class:`Location` object).
-    :param options: Any keyword arguments are passed on to
+    :param ssh_multiplexing: :data:`True` to share a single SSH connection
+                             between the commands run for a remote location
+                             (see :func:`get_multiplexing_command()`),
+                             :data:`False` otherwise (the default).
+    :param options: Any other keyword arguments are passed on to
                     :func:`~executor.contexts.create_context()`.
     :returns: A :class:`Location` object.
     """
+    ssh_multiplexing = options.pop('ssh_multiplexing', False)
     # Location objects pass through untouched.
     if not isinstance(value, Location):
         # Other values are expected to be strings.
@@ -128,6 +258,8 @@ def coerce_location(value, **options):
         ssh_alias, _, directory = value.partition(':')
         if ssh_alias and directory and '/' not in ssh_alias:
             options['ssh_alias'] = ssh_alias
+            if ssh_multiplexing and 'ssh_command' not in options:
+                options['ssh_command'] = get_multiplexing_command()
         else:
             directory = value
         # Create the location object.
@@ -153,20 +285,28 @@ def coerce_retention_period(value):
         if not isinstance(value, string_types):
             msg = "Expected string, got %s instead!"
             raise ValueError(msg % type(value))
+        # Reuse the result of a previous coercion of the same string.
+        if value in RETENTION_PERIOD_CACHE:
+            return RETENTION_PERIOD_CACHE[value]
+        expression = value
         # Check for the literal string `always'.
         value = value.strip()
         if value.lower() == 'always':
             value = 'always'
+        elif value.isdigit():
+            # Plain integers don't need to be evaluated as expressions.
+            value = int(value, 10)
         else:
             # Evaluate other strings as expressions.
             value = simple_eval(value)
             if not isinstance(value, numbers.Number):
                 msg = "Expected numeric result, got %s instead!"
                 raise ValueError(msg % type(value))
+        RETENTION_PERIOD_CACHE[expression] = value
     return value
 
 
-def load_config_file(configuration_file=None, expand=True):
+def load_config_file(configuration_file=None, expand=True, ssh_multiplexing=False):
     """
     Load a configuration file with backup directories and rotation schemes.
 
@@ -174,6 +314,9 @@ def load_config_file(configuration_file=None, expand=True):
                                to load (a string or :data:`None`).
     :param expand: :data:`True` to expand filename patterns to their matches,
                    :data:`False` otherwise.
+    :param ssh_multiplexing: The default value of the ``ssh-multiplexing``
+                             option for sections that don't set it (a
+                             boolean, defaults to :data:`False`).
     :returns: A generator of tuples with four values each:
 
               1. An execution context created using :mod:`executor.contexts`.
@@ -198,36 +341,9 @@ def load_config_file(configuration_file=None, expand=True):
     sections by the same name in system-wide configuration files.
     """
     expand_notice_given = False
-    if configuration_file:
-        loader = ConfigLoader(available_files=[configuration_file], strict=True)
-    else:
-        loader = ConfigLoader(program_name='rotate-backups', strict=False)
-    for section in loader.section_names:
-        items = dict(loader.get_options(section))
-        context_options = {}
-        if coerce_boolean(items.get('use-sudo')):
-            context_options['sudo'] = True
-        if items.get('ssh-user'):
-            context_options['ssh_user'] = items['ssh-user']
-        location = coerce_location(section, **context_options)
-        rotation_scheme = dict((name, coerce_retention_period(items[name]))
-                               for name in SUPPORTED_FREQUENCIES
-                               if name in items)
-        options = dict(
-            exclude_list=split(items.get('exclude-list', '')),
-            include_list=split(items.get('include-list', '')),
-            io_scheduling_class=items.get('ionice'),
-            prefer_recent=coerce_boolean(items.get('prefer-recent', 'no')),
-            strict=coerce_boolean(items.get('strict', 'yes')),
-        )
-        # Don't override the value of the 'removal_command' property unless the
-        # 'removal-command' configuration file option has a value set.
-        if items.get('removal-command'):
-            options['removal_command'] = shlex.split(items['removal-command'])
-        # Don't override the value of the 'timestamp_pattern' property unless the
-        # 'timestamp-pattern' configuration file option has a value set.
-        if items.get('timestamp-pattern'):
-            options['timestamp_pattern'] = items['timestamp-pattern']
+    sections = load_config_sections(create_config_loader(configuration_file))[0]
+    for section, items in sections:
+        location, rotation_scheme, options = parse_config_section(section, items, ssh_multiplexing)
         # Expand filename patterns?
         if expand and location.have_wildcards:
             logger.verbose("Expanding filename pattern %s on %s ..", location.directory, location.context)
@@ -245,6 +361,138 @@ def load_config_file(configuration_file=None, expand=True):
             yield location, rotation_scheme, options
 
 
+def create_config_loader(configuration_file=None):
+    """
+    Create a loader for the configuration file(s) of the `rotate-backups` program.
+
+    :param configuration_file: Override the pathname of the configuration file
+                               to load (a string or :data:`None`).
+    :returns: A :class:`~update_dotdee.ConfigLoader` object.
+    """
+    if configuration_file:
+        return ConfigLoader(available_files=[configuration_file], strict=True)
+    else:
+        return ConfigLoader(program_name='rotate-backups', strict=False)
+
+
+def load_config_sections(loader):
+    """
+    Load the sections of the configuration files found by a configuration loader.
+
+    :param loader: A :class:`~update_dotdee.ConfigLoader` object.
+    :returns: A tuple with three values:
+
+              1. A list of tuples with two values each: The name of a
+                 section and a dictionary with the options in that section
+                 (both can be passed to :func:`parse_config_section()`).
+              2. A dictionary that maps tuples with the SSH alias and the
+                 normalized directory of locations without filename patterns
+                 to the index of the first section for that location.
+              3. A list with the indexes of the sections whose location
+                 is a filename pattern.
+    :raises: :exc:`~exceptions.ValueError` when the loader is strict and a
+             configuration file can't be loaded.
+
+    The loaded sections are stored in :data:`CONFIG_FILE_CACHE` so that
+    configuration files that haven't changed (based on their last modification
+    time, size and mode) aren't parsed again. Because the returned values are shared
+    between callers they must not be modified.
+    """
+    try:
+        signatures = tuple(get_file_signature(fn) for fn in loader.available_files)
+        cache_key = tuple(signature[0] for signature in signatures)
+    except OSError:
+        # Let the loader report missing configuration files.
+        signatures = cache_key = None
+    cached_signatures, cached_result = CONFIG_FILE_CACHE.get(cache_key, (None, None))
+    if signatures is not None and cached_signatures == signatures:
+        return cached_result
+    sections = [(section, loader.get_options(section)) for section in loader.section_names]
+    # Index the configured locations so that RotateBackups.load_config_file()
+    # doesn't need to try to match every section against a given location.
+    literal_locations = {}
+    pattern_locations = []
+    for i, (section, items) in enumerate(sections):
+        location = coerce_location(section)
+        if location.have_wildcards:
+            pattern_locations.append(i)
+        else:
+            literal_locations.setdefault((location.ssh_alias, os.path.normpath(location.directory)), i)
+    result = sections, literal_locations, pattern_locations
+    # Configuration files that can't be read are skipped by non-strict
+    # loaders. The result isn't cached in that case, so that the sections
+    # are loaded once the file becomes readable.
+    if cache_key is not None and all(os.access(fn, os.R_OK) for fn in cache_key):
+        CONFIG_FILE_CACHE[cache_key] = signatures, result
+    return result
+
+
+def parse_config_section(section, items, ssh_multiplexing=False):
+    """
+    Parse a configuration file section.
+
+    :param section: The name of the section (a string).
+    :param items: A dictionary with the options in the section.
+    :param ssh_multiplexing: The default value of the ``ssh-multiplexing``
+                             option (a boolean, defaults to :data:`False`).
+    :returns: A tuple with three values (the same values that are generated
+              by :func:`load_config_file()`, but without expanding filename
+              patterns):
+
+              1. A :class:`Location` object.
+              2. A dictionary with the rotation scheme.
+              3. A dictionary with additional options.
+
+    Every call returns new objects, so callers are free to modify them.
+    """
+    context_options = {}
+    if coerce_boolean(items.get('use-sudo')):
+        context_options['sudo'] = True
+    if items.get('ssh-user'):
+        context_options['ssh_user'] = items['ssh-user']
+    if coerce_boolean(items.get('ssh-multiplexing', ssh_multiplexing)):
+        context_options['ssh_multiplexing'] = True
+    location = coerce_location(section, **context_options)
+    rotation_scheme = dict((name, coerce_retention_period(value))
+                           for name, value in items.items()
+                           if name in SUPPORTED_FREQUENCIES)
+    options = dict(
+        exclude_list=split(items.get('exclude-list', '')),
+        include_list=split(items.get('include-list', '')),
+        io_scheduling_class=items.get('ionice'),
+        prefer_recent=coerce_boolean(items.get('prefer-recent', 'no')),
+        strict=coerce_boolean(items.get('strict', 'yes')),
+    )
+    # Don't override the value of the 'removal_command' property unless the
+    # 'removal-command' configuration file option has a value set.
+    if items.get('removal-command'):
+        options['removal_command'] = shlex.split(items['removal-command'])
+    # Don't override the value of the 'timestamp_pattern' property unless the
+    # 'timestamp-pattern' configuration file option has a value set.
+    if items.get('timestamp-pattern'):
+        options['timestamp_pattern'] = items['timestamp-pattern']
+    return location, rotation_scheme, options
+
+
+def get_file_signature(filename):
+    """
+    Get a signature that changes when the given file is changed.
+
+    :param filename: The pathname of a file (a string).
+    :returns: A tuple with the absolute pathname, last modification time (in
+              nanoseconds when available), size and mode of the file (all
+              obtained using a single :func:`os.stat()` call).
+    :raises: :exc:`~exceptions.OSError` when the file doesn't exist.
+    """
+    metadata = os.stat(filename)
+    return (
+        os.path.abspath(filename),
+        getattr(metadata, 'st_mtime_ns', metadata.st_mtime),
+        metadata.st_size,
+        metadata.st_mode,
+    )
+
+
 def rotate_backups(directory, rotation_scheme, **options):
     """
     Rotate the backups in a directory according to a flexible rotation scheme.
@@ -310,7 +558,8 @@ class RotateBackups(PropertyManager):
         :func:`collect_backups()` encounters a backup whose name matches any of
         the patterns in this list the backup will be ignored, *even if it also
         matches the include list* (it's the only logical way to combine both
-        lists).
+        lists). Patterns that were already compiled using
+        :func:`compile_filename_pattern()` are also accepted.
 
         :see also: :attr:`include_list`
         """
@@ -345,7 +594,8 @@ class RotateBackups(PropertyManager):
 
         This is a list of strings with :mod:`fnmatch` patterns. When it's not
         empty :func:`collect_backups()` will only collect backups whose name
-        matches a pattern in the list.
+        matches a pattern in the list. Patterns that were already compiled
+        using :func:`compile_filename_pattern()` are also accepted.
 
         :see also: :attr:`exclude_list`
         """
@@ -388,6 +638,10 @@ class RotateBackups(PropertyManager):
         it works regardless of whether the user's "backups to be rotated" are
         files or directories or a mixture of both.
 
+        The default command is given up to :data:`REMOVAL_BATCH_SIZE`
+        pathnames at once, whereas a custom command is run once for every
+        backup that is removed (because its semantics are unknown).
+
         .. versionadded: 5.3
            This option was added as a generalization of the idea suggested in
            `pull request 11`_, which made it clear to me that being able to
@@ -486,7 +740,10 @@ class RotateBackups(PropertyManager):
         Rotate the backups in the given locations concurrently.
 
         :param locations: One or more values accepted by :func:`coerce_location()`.
-        :param kw: Any keyword arguments are passed on to :func:`rotate_backups()`.
+        :param concurrency: The maximum number of backups to remove at the
+                            same time (an integer, defaults to 10).
+        :param kw: Any other keyword arguments are passed on to
+                   :func:`rotate_backups()`.
 
         This function uses :func:`rotate_backups()` to prepare rotation
         commands for the given locations and then it removes backups in
@@ -496,18 +753,36 @@ class RotateBackups(PropertyManager):
         when the files to be removed are on different disks and so multiple
         devices can be utilized at the same time.
 
+        Removal of backups starts as soon as the first location has been
+        scanned, so that scanning of the remaining locations (which can
+        involve SSH round trips) overlaps with the removal of backups. Failed
+        removals are reported (by raising
+        :exc:`~executor.concurrent.CommandPoolFailed`) after all locations
+        have been scanned and all removal commands have finished, so that a
+        failure in one location doesn't prevent rotation of the others.
+
         Because mount points are per system :func:`rotate_concurrent()` will
         also parallelize over backups located on multiple remote systems.
         """
         timer = Timer()
-        pool = CommandPool(concurrency=10)
+        pool = CommandPool(concurrency=kw.pop('concurrency', 10), delay_checks=True)
         logger.info("Scanning %s ..", pluralize(len(locations), "backup location"))
-        for location in locations:
-            for cmd in self.rotate_backups(location, prepare=True, **kw):
-                pool.add(cmd)
+        try:
+            for location in locations:
+                commands = self.rotate_backups(location, prepare=True, **kw)
+                if commands:
+                    logger.info("Preparing to rotate %s (in parallel) ..", location)
+                    for cmd in commands:
+                        pool.add(cmd)
+                    # Start removing backups while the remaining locations are
+                    # scanned (results are collected once scanning is done).
+                    pool.spawn()
+        except Exception:
+            # Don't leave commands that were already started running unattended.
+            pool.terminate()
+            raise
         if pool.num_commands > 0:
             backups = pluralize(pool.num_commands, "backup")
-            logger.info("Preparing to rotate %s (in parallel) ..", backups)
             pool.run()
             logger.info("Successfully rotated %s in %s.", backups, timer)
 
@@ -548,7 +823,7 @@ class RotateBackups(PropertyManager):
         sorted_backups = self.collect_backups(location)
         if not sorted_backups:
             logger.info("No backups found in %s.", location)
-            return
+            return rotation_commands
         # Make sure the directory is writable, but only when the default
         # removal command is being used (because custom removal commands
         # imply custom semantics that we shouldn't get in the way of, see
@@ -563,35 +838,49 @@ class RotateBackups(PropertyManager):
         self.apply_rotation_scheme(backups_by_frequency, most_recent_backup.timestamp)
         # Find which backups to preserve and why.
         backups_to_preserve = self.find_preservation_criteria(backups_by_frequency)
+        # Index the preserved backups by pathname so that the loop below
+        # can use cheap string lookups instead of hashing Backup objects.
+        preserved_pathnames = dict((b.pathname, p) for b, p in backups_to_preserve.items())
         # Apply the calculated rotation scheme.
+        backups_to_remove = []
         for backup in sorted_backups:
             friendly_name = backup.pathname
             if not location.is_remote:
                 # Use human friendly pathname formatting for local backups.
                 friendly_name = format_path(backup.pathname)
-            if backup in backups_to_preserve:
-                matching_periods = backups_to_preserve[backup]
+            matching_periods = preserved_pathnames.get(backup.pathname)
+            if matching_periods is not None:
                 logger.info("Preserving %s (matches %s retention %s) ..",
                             friendly_name, concatenate(map(repr, matching_periods)),
                             "period" if len(matching_periods) == 1 else "periods")
             else:
                 logger.info("Deleting %s ..", friendly_name)
                 if not self.dry_run:
-                    # Copy the list with the (possibly user defined) removal command.
-                    removal_command = list(self.removal_command)
-                    # Add the pathname of the backup as the final argument.
-                    removal_command.append(backup.pathname)
-                    # Construct the command object.
-                    command = location.context.prepare(
-                        command=removal_command,
-                        group_by=(location.ssh_alias, location.mount_point),
-                        ionice=self.io_scheduling_class,
-                    )
-                    rotation_commands.append(command)
-                    if not prepare:
-                        timer = Timer()
-                        command.wait()
-                        logger.verbose("Deleted %s in %s.", friendly_name, timer)
+                    backups_to_remove.append((backup.pathname, friendly_name))
+        # The default removal command accepts any number of pathnames so we
+        # remove backups in batches (saving a process and, for remote
+        # locations, an SSH round trip per backup). Custom removal commands
+        # imply custom semantics so they're given a single pathname.
+        batch_size = REMOVAL_BATCH_SIZE if self.removal_command == DEFAULT_REMOVAL_COMMAND else 1
+        for offset in range(0, len(backups_to_remove), batch_size):
+            batch = backups_to_remove[offset:offset + batch_size]
+            # Copy the list with the (possibly user defined) removal command.
+            removal_command = list(self.removal_command)
+            # Add the pathname(s) of the backup(s) as the final argument(s).
+            removal_command.extend(pathname for pathname, friendly_name in batch)
+            # Construct the command object.
+            command = location.context.prepare(
+                command=removal_command,
+                group_by=(location.ssh_alias, location.mount_point),
+                ionice=self.io_scheduling_class,
+            )
+            rotation_commands.append(command)
+            if not prepare:
+                timer = Timer()
+                command.wait()
+                logger.verbose("Deleted %s in %s.",
+                               batch[0][1] if len(batch) == 1 else pluralize(len(batch), "backup"),
+                               timer)
         if len(backups_to_preserve) == len(sorted_backups):
             logger.info("Nothing to do! (all backups preserved)")
         return rotation_commands
@@ -604,27 +893,42 @@ class RotateBackups(PropertyManager):
         :returns: The configured or given :class:`Location` object.
         """
         location = coerce_location(location)
-        for configured_location, rotation_scheme, options in load_config_file(self.config_file, expand=False):
-            if configured_location.match(location):
-                logger.verbose("Loading configuration for %s ..", location)
-                if rotation_scheme:
-                    self.rotation_scheme = rotation_scheme
-                for name, value in options.items():
-                    if value:
-                        setattr(self, name, value)
-                # Create a new Location object based on the directory of the
-                # given location and the execution context of the configured
-                # location, because:
-                #
-                # 1. The directory of the configured location may be a filename
-                #    pattern whereas we are interested in the expanded name.
-                #
-                # 2. The execution context of the given location may lack some
-                #    details of the configured location.
-                return Location(
-                    context=configured_location.context,
-                    directory=location.directory,
-                )
+        loader = create_config_loader(self.config_file)
+        sections, literal_locations, pattern_locations = load_config_sections(loader)
+        # Find the first section that matches the location, either literally
+        # or as a filename pattern (sections are ordered by their name).
+        index = literal_locations.get((location.ssh_alias, os.path.normpath(location.directory)))
+        for i in pattern_locations:
+            if index is not None and i > index:
+                break
+            if coerce_location(sections[i][0]).match(location):
+                index = i
+                break
+        if index is not None:
+            configured_location, rotation_scheme, options = parse_config_section(*sections[index])
+            logger.verbose("Loading configuration for %s ..", location)
+            if rotation_scheme:
+                self.rotation_scheme = rotation_scheme
+            for name, value in options.items():
+                if value:
+                    setattr(self, name, value)
+            # Create a new Location object based on the directory of the
+            # given location and the execution context of the configured
+            # location, because:
+            #
+            # 1. The directory of the configured location may be a filename
+            #    pattern whereas we are interested in the expanded name.
+            #
+            # 2. The execution context of the given location may lack some
+            #    details of the configured location.
+            #
+            # SSH connection sharing enabled for the given location is
+            # preserved (the configured location is ours to modify).
+            context = configured_location.context
+            ssh_command = location.context.options.get('ssh_command')
+            if ssh_command and 'ssh_command' not in context.options:
+                context.options['ssh_command'] = ssh_command
+            return Location(context=context, directory=location.directory)
         logger.verbose("No configuration found for %s.", location)
         return location
 
@@ -640,14 +944,19 @@ class RotateBackups(PropertyManager):
         """
         backups = []
         location = coerce_location(location)
+        # Translate the filename patterns to regular expressions only once.
+        match_exclude = compile_filename_patterns(self.exclude_list)
+        match_include = compile_filename_patterns(self.include_list)
+        # Resolve the timestamp pattern once instead of once per entry.
+        search_timestamp = self.timestamp_pattern.search
         logger.info("Scanning %s for backups ..", location)
         location.ensure_readable(self.force)
-        for entry in natsort(location.context.list_entries(location.directory)):
-            match = self.timestamp_pattern.search(entry)
+        for entry in natsort(location.list_entries()):
+            match = search_timestamp(entry)
             if match:
-                if self.exclude_list and any(fnmatch.fnmatch(entry, p) for p in self.exclude_list):
+                if match_exclude and match_exclude(entry):
                     logger.verbose("Excluded %s (it matched the exclude list).", entry)
-                elif self.include_list and not any(fnmatch.fnmatch(entry, p) for p in self.include_list):
+                elif match_include and not match_include(entry):
                     logger.verbose("Excluded %s (it didn't match the include list).", entry)
                 else:
                     try:
@@ -661,7 +970,9 @@ class RotateBackups(PropertyManager):
                 logger.debug("Failed to match time stamp in filename: %s", entry)
         if backups:
             logger.info("Found %i timestamped backups in %s.", len(backups), location)
-        return sorted(backups)
+        # Sort on the key properties of the backups directly, to avoid the
+        # overhead of the rich comparison methods of Backup objects.
+        return sorted(backups, key=operator.attrgetter(*Backup.key_properties))
 
     def match_to_datetime(self, match):
         """
@@ -701,13 +1012,23 @@ class RotateBackups(PropertyManager):
                   rotation frequency.
         """
         backups_by_frequency = dict((frequency, collections.defaultdict(list)) for frequency in SUPPORTED_FREQUENCIES)
+        minutely = backups_by_frequency['minutely']
+        hourly = backups_by_frequency['hourly']
+        daily = backups_by_frequency['daily']
+        weekly = backups_by_frequency['weekly']
+        monthly = backups_by_frequency['monthly']
+        yearly = backups_by_frequency['yearly']
         for b in backups:
-            backups_by_frequency['minutely'][(b.year, b.month, b.day, b.hour, b.minute)].append(b)
-            backups_by_frequency['hourly'][(b.year, b.month, b.day, b.hour)].append(b)
-            backups_by_frequency['daily'][(b.year, b.month, b.day)].append(b)
-            backups_by_frequency['weekly'][(b.year, b.week)].append(b)
-            backups_by_frequency['monthly'][(b.year, b.month)].append(b)
-            backups_by_frequency['yearly'][b.year].append(b)
+            # Access the timestamp of each backup only once, instead of
+            # going through Backup.__getattr__() for every date component.
+            timestamp = b.timestamp
+            year, month, day = timestamp.year, timestamp.month, timestamp.day
+            minutely[(year, month, day, timestamp.hour, timestamp.minute)].append(b)
+            hourly[(year, month, day, timestamp.hour)].append(b)
+            daily[(year, month, day)].append(b)
+            weekly[(year, timestamp.isocalendar()[1])].append(b)
+            monthly[(year, month)].append(b)
+            yearly[year].append(b)
         return backups_by_frequency
 
     def apply_rotation_scheme(self, backups_by_frequency, most_recent_backup):
@@ -726,37 +1047,43 @@ class RotateBackups(PropertyManager):
                   backups that should be removed to apply the user defined
                   rotation scheme.
         """
-        if not self.rotation_scheme:
+        # Resolve the properties we need only once (instead of per frequency).
+        rotation_scheme = self.rotation_scheme
+        select_backup = max if self.prefer_recent else min
+        strict = self.strict
+        if not rotation_scheme:
             raise ValueError("Refusing to use empty rotation scheme! (all backups would be deleted)")
         for frequency, backups in backups_by_frequency.items():
             # Ignore frequencies not specified by the user.
-            if frequency not in self.rotation_scheme:
+            if frequency not in rotation_scheme:
                 backups.clear()
             else:
                 # Reduce the number of backups in each time slot of this
                 # rotation frequency to a single backup (the oldest one or the
                 # newest one).
                 for period, backups_in_period in backups.items():
-                    index = -1 if self.prefer_recent else 0
-                    selected_backup = sorted(backups_in_period)[index]
-                    backups[period] = [selected_backup]
+                    backups[period] = [select_backup(backups_in_period)]
                 # Check if we need to rotate away backups in old periods.
-                retention_period = self.rotation_scheme[frequency]
+                retention_period = rotation_scheme[frequency]
                 if retention_period != 'always':
                     # Remove backups created before the minimum date of this
                     # rotation frequency? (relative to the most recent backup)
-                    if self.strict:
-                        minimum_date = most_recent_backup - SUPPORTED_FREQUENCIES[frequency] * retention_period
-                        for period, backups_in_period in list(backups.items()):
-                            for backup in backups_in_period:
-                                if backup.timestamp < minimum_date:
-                                    backups_in_period.remove(backup)
-                            if not backups_in_period:
-                                backups.pop(period)
+                    if strict:
+                        delta = SUPPORTED_FREQUENCIES[frequency]
+                        minimum_date = most_recent_backup - delta * retention_period
+                        # Each period contains a single backup at this point.
+                        backups = dict((period, backups_in_period)
+                                       for period, backups_in_period in backups.items()
+                                       if backups_in_period[0].timestamp >= minimum_date)
+                        backups_by_frequency[frequency] = backups
                     # If there are more periods remaining than the user
                     # requested to be preserved we delete the oldest one(s).
-                    items_to_preserve = sorted(backups.items())[-retention_period:]
-                    backups_by_frequency[frequency] = dict(items_to_preserve)
+                    if 0 < retention_period < len(backups):
+                        items_to_preserve = heapq.nlargest(
+                            retention_period, backups.items(),
+                            key=operator.itemgetter(0),
+                        )
+                        backups_by_frequency[frequency] = dict(items_to_preserve)
 
     def find_preservation_criteria(self, backups_by_frequency):
         """
@@ -769,11 +1096,15 @@ class RotateBackups(PropertyManager):
                   :class:`list` objects containing strings (rotation
                   frequencies) as values.
         """
-        backups_to_preserve = collections.defaultdict(list)
+        backups_to_preserve = {}
         for frequency, delta in ORDERED_FREQUENCIES:
             for period in backups_by_frequency[frequency].values():
                 for backup in period:
-                    backups_to_preserve[backup].append(frequency)
+                    matching_periods = backups_to_preserve.get(backup)
+                    if matching_periods is None:
+                        backups_to_preserve[backup] = [frequency]
+                    else:
+                        matching_periods.append(frequency)
         return backups_to_preserve
 
 
@@ -789,6 +1120,51 @@ class Location(PropertyManager):
     def directory(self):
         """The pathname of a directory containing backups (a string)."""
 
+    @lazy_property
+    def access_checks(self):
+        """
+        The results of the sanity checks on :attr:`directory` (a tuple of three booleans).
+
+        The booleans indicate whether the directory exists, is readable and is
+        writable. When :attr:`direct_access` is :data:`True` the checks are
+        performed using :mod:`os` functions, otherwise a single shell command
+        performs all three checks (for remote locations this takes one SSH
+        round trip instead of three). The shell command reports the results
+        as bits in its exit status (so that output from shell startup files
+        can't interfere with the checks).
+
+        .. seealso:: :func:`ensure_exists()`, :func:`ensure_readable()` and :func:`ensure_writable()`
+        """
+        if self.direct_access:
+            return (
+                os.path.isdir(self.directory),
+                os.access(self.directory, os.R_OK),
+                os.access(self.directory, os.W_OK),
+            )
+        cmd = self.context.execute(
+            'sh', '-c', 'd=0 r=0 w=0; test -d "$1" && d=4; test -r "$1" && r=2; test -w "$1" && w=1; '
+                        'exit $((8 + d + r + w))',
+            'rotate-backups', self.directory, check=False, silent=True,
+        )
+        if not 8 <= cmd.returncode <= 15:
+            # Treat a failure to run the checks as failing checks.
+            return False, False, False
+        return bool(cmd.returncode & 4), bool(cmd.returncode & 2), bool(cmd.returncode & 1)
+
+    @lazy_property
+    def direct_access(self):
+        """
+        :data:`True` if :attr:`directory` can be accessed in-process, :data:`False` otherwise.
+
+        This is the case for locations on the local system whose execution
+        context doesn't use ``sudo`` or switch to another user. For such
+        locations directory listings are obtained using :mod:`os` functions
+        instead of forking external commands.
+        """
+        if isinstance(self.context, LocalContext):
+            return not any(map(self.context.options.get, ('sudo', 'uid', 'user')))
+        return False
+
     @lazy_property
     def have_ionice(self):
         """:data:`True` when ionice_ is available, :data:`False` otherwise."""
@@ -849,7 +1225,7 @@ class Location(PropertyManager):
 
         .. seealso:: :func:`ensure_readable()`, :func:`ensure_writable()` and :func:`add_hints()`
         """
-        if self.context.is_directory(self.directory):
+        if self.access_checks[0]:
             logger.verbose("Confirmed that location exists: %s", self)
             return True
         elif override:
@@ -876,7 +1252,7 @@ class Location(PropertyManager):
         # existence has been confirmed, to avoid multiple notices
         # about the same underlying problem.
         if self.ensure_exists(override):
-            if self.context.is_readable(self.directory):
+            if self.access_checks[1]:
                 logger.verbose("Confirmed that location is readable: %s", self)
                 return True
             elif override:
@@ -903,7 +1279,7 @@ class Location(PropertyManager):
         # existence has been confirmed, to avoid multiple notices
         # about the same underlying problem.
         if self.ensure_exists(override):
-            if self.context.is_writable(self.directory):
+            if self.access_checks[2]:
                 logger.verbose("Confirmed that location is writable: %s", self)
                 return True
             elif override:
@@ -913,6 +1289,24 @@ class Location(PropertyManager):
                 raise ValueError(self.add_hints(message % self))
         return False
 
+    def list_entries(self):
+        """
+        List the entries in :attr:`directory`.
+
+        :returns: A list of strings with the names of the directory entries.
+
+        When :attr:`direct_access` is :data:`True` :func:`os.listdir()` is
+        used, otherwise :func:`~executor.contexts.AbstractContext.list_entries()`
+        is used (which runs ``find`` on the system of the execution context).
+        """
+        if self.direct_access:
+            try:
+                return os.listdir(self.directory)
+            except OSError:
+                # Let the execution context report the problem.
+                pass
+        return self.context.list_entries(self.directory)
+
     def add_hints(self, message):
         """
         Provide hints about failing sanity checks.
@@ -951,6 +1345,9 @@ class Location(PropertyManager):
         elif self.have_wildcards:
             # Match filename patterns using fnmatch().
             return fnmatch.fnmatch(location.directory, self.directory)
+        elif self.directory == location.directory:
+            # Identical pathnames don't need to be normalized.
+            return True
         else:
             # Compare normalized directory pathnames.
             self = os.path.normpath(self.directory)
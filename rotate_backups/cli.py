@@ -98,6 +98,16 @@ Supported options:
     Because mount points are per system the -j, --parallel option will also
     parallelize over backups located on multiple remote systems.
 
+  -W, --workers=COUNT
+
+    Rotate up to COUNT locations at the same time, using a separate thread
+    for each location. This is useful when rotating many (remote) locations
+    because scanning one location no longer has to wait for the rotation of
+    the previous location to finish. When the rotation of one location fails
+    the other locations are still rotated. When the -j, --parallel option is
+    given COUNT instead limits the number of backups that are removed at the
+    same time (the default is 10).
+
   -p, --prefer-recent
 
     By default the first (oldest) backup in each time slot is preserved. If
@@ -168,11 +178,22 @@ Supported options:
     readable and/or writable for the current user (or the user logged in to a
     remote system over SSH).
 
+  -s, --ssh-multiplexing
+
+    Share a single SSH connection between all commands that are run for a
+    remote location, instead of connecting to the remote system for every
+    command. This uses the ControlMaster, ControlPath and ControlPersist
+    options of OpenSSH, which means it overrides any Control* options in your
+    SSH configuration. Sockets are created in ~/.cache/rotate-backups. This
+    option also applies to configured locations, unless their configuration
+    file section sets the `ssh-multiplexing' option.
+
   -S, --syslog=CHOICE
 
     Explicitly enable or disable system logging instead of letting the program
     figure out what to do. The values '1', 'yes', 'true' and 'on' enable system
-    logging whereas the values '0', 'no', 'false' and 'off' disable it.
+    logging whereas the values '0', 'no', 'false' and 'off' disable it. By
+    default system logging is disabled on Windows and during dry runs.
 
   -f, --force
 
@@ -205,6 +226,7 @@ Supported options:
 import getopt
 import shlex
 import sys
+from multiprocessing.pool import ThreadPool
 
 # External dependencies.
 import coloredlogs
@@ -221,54 +243,69 @@ from rotate_backups import (
     RotateBackups,
     coerce_location,
     coerce_retention_period,
+    compile_filename_pattern,
     load_config_file,
 )
 
 # Initialize a logger.
 logger = VerboseLogger(__name__)
 
+FREQUENCY_OPTIONS = {
+    '-M': 'minutely', '--minutely': 'minutely',
+    '-H': 'hourly', '--hourly': 'hourly',
+    '-d': 'daily', '--daily': 'daily',
+    '-w': 'weekly', '--weekly': 'weekly',
+    '-m': 'monthly', '--monthly': 'monthly',
+    '-y': 'yearly', '--yearly': 'yearly',
+}
+"""A dictionary that maps command line options to rotation frequencies (strings)."""
 
-def main():
-    """Command line interface for the ``rotate-backups`` program."""
+
+def main(argv=None):
+    """
+    Command line interface for the ``rotate-backups`` program.
+
+    :param argv: The command line arguments to parse (a list of strings,
+                 defaults to :data:`sys.argv` without the program name).
+    """
     coloredlogs.install()
     # Command line option defaults.
     rotation_scheme = {}
     kw = dict(include_list=[], exclude_list=[])
     parallel = False
+    workers = None
     use_sudo = False
-    use_syslog = (not on_windows())
+    ssh_multiplexing = False
+    use_syslog = None
     # Internal state.
     selected_locations = []
+    parsed_arguments = {}
     # Parse the command line arguments.
     try:
-        options, arguments = getopt.getopt(sys.argv[1:], 'M:H:d:w:m:y:t:I:x:jpri:c:C:uS:fnvqh', [
+        if argv is None:
+            argv = sys.argv[1:]
+        options, arguments = getopt.getopt(argv, 'M:H:d:w:m:y:t:I:x:jW:pri:c:C:usS:fnvqh', [
             'minutely=', 'hourly=', 'daily=', 'weekly=', 'monthly=', 'yearly=',
             'timestamp-pattern=', 'include=', 'exclude=', 'parallel',
-            'prefer-recent', 'relaxed', 'ionice=', 'config=',
-            'removal-command=', 'use-sudo', 'syslog=', 'force',
+            'workers=', 'prefer-recent', 'relaxed', 'ionice=', 'config=',
+            'removal-command=', 'use-sudo', 'ssh-multiplexing', 'syslog=', 'force',
             'dry-run', 'verbose', 'quiet', 'help',
         ])
         for option, value in options:
-            if option in ('-M', '--minutely'):
-                rotation_scheme['minutely'] = coerce_retention_period(value)
-            elif option in ('-H', '--hourly'):
-                rotation_scheme['hourly'] = coerce_retention_period(value)
-            elif option in ('-d', '--daily'):
-                rotation_scheme['daily'] = coerce_retention_period(value)
-            elif option in ('-w', '--weekly'):
-                rotation_scheme['weekly'] = coerce_retention_period(value)
-            elif option in ('-m', '--monthly'):
-                rotation_scheme['monthly'] = coerce_retention_period(value)
-            elif option in ('-y', '--yearly'):
-                rotation_scheme['yearly'] = coerce_retention_period(value)
+            if option in FREQUENCY_OPTIONS:
+                rotation_scheme[FREQUENCY_OPTIONS[option]] = coerce_retention_period(value)
             elif option in ('-t', '--timestamp-pattern'):
                 kw['timestamp_pattern'] = value
             elif option in ('-I', '--include'):
-                kw['include_list'].append(value)
+                kw['include_list'].append(compile_filename_pattern(value))
             elif option in ('-x', '--exclude'):
-                kw['exclude_list'].append(value)
+                kw['exclude_list'].append(compile_filename_pattern(value))
             elif option in ('-j', '--parallel'):
                 parallel = True
+            elif option in ('-W', '--workers'):
+                workers = int(value)
+                if workers < 1:
+                    raise ValueError("The number of workers should be at least one! (got %i)" % workers)
             elif option in ('-p', '--prefer-recent'):
                 kw['prefer_recent'] = True
             elif option in ('-r', '--relaxed'):
@@ -284,6 +321,8 @@ def main():
                 kw['removal_command'] = removal_command
             elif option in ('-u', '--use-sudo'):
                 use_sudo = True
+            elif option in ('-s', '--ssh-multiplexing'):
+                ssh_multiplexing = True
             elif option in ('-S', '--syslog'):
                 use_syslog = coerce_boolean(value)
             elif option in ('-f', '--force'):
@@ -300,6 +339,8 @@ def main():
                 return
             else:
                 assert False, "Unhandled option! (programming error)"
+        if use_syslog is None:
+            use_syslog = not (on_windows() or kw.get('dry_run'))
         if use_syslog:
             enable_system_logging()
         if rotation_scheme:
@@ -307,13 +348,20 @@ def main():
         if arguments:
             # Rotation of the locations given on the command line.
             location_source = 'command line arguments'
-            selected_locations.extend(coerce_location(value, sudo=use_sudo) for value in arguments)
+            # Each distinct argument is parsed (and rotated) only once.
+            for value in arguments:
+                if value not in parsed_arguments:
+                    parsed_arguments[value] = coerce_location(value, sudo=use_sudo, ssh_multiplexing=ssh_multiplexing)
+                    selected_locations.append(parsed_arguments[value])
         else:
             # Rotation of all configured locations.
             location_source = 'configuration file'
             selected_locations.extend(
-                location for location, rotation_scheme, options
-                in load_config_file(configuration_file=kw.get('config_file'), expand=True)
+                location for location, _, _ in load_config_file(
+                    configuration_file=kw.get('config_file'),
+                    expand=True,
+                    ssh_multiplexing=ssh_multiplexing,
+                )
             )
         # Inform the user which location(s) will be rotated.
         if selected_locations:
@@ -333,7 +381,34 @@ def main():
     # Rotate the backups in the selected directories.
     program = RotateBackups(rotation_scheme, **kw)
     if parallel:
-        program.rotate_concurrent(*selected_locations)
+        if workers:
+            program.rotate_concurrent(*selected_locations, concurrency=workers)
+        else:
+            program.rotate_concurrent(*selected_locations)
+    elif workers and workers > 1 and len(selected_locations) > 1:
+        # Each worker gets its own RotateBackups object because rotation
+        # settings loaded from a configuration file are applied to the
+        # object that rotates the location.
+        pool = ThreadPool(min(workers, len(selected_locations)))
+        try:
+            results = [
+                (location, pool.apply_async(RotateBackups(rotation_scheme, **kw).rotate_backups, (location,)))
+                for location in selected_locations
+            ]
+        finally:
+            pool.close()
+            pool.join()
+        # A failure to rotate one location doesn't abort the rotation of the
+        # other locations, but it is reported and it affects the exit code.
+        failures = 0
+        for location, result in results:
+            try:
+                result.get()
+            except Exception:
+                logger.exception("Failed to rotate %s!", location)
+                failures += 1
+        if failures:
+            sys.exit(1)
     else:
         for location in selected_locations:
             program.rotate_backups(location)
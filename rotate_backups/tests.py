@@ -8,29 +8,33 @@
 
 # Standard library modules.
 import contextlib
-import datetime
-import logging
+import fnmatch
 import os
+import re
 
 # External dependencies.
 from executor import ExternalCommandFailed
+from executor.concurrent import CommandPoolFailed
 from executor.contexts import RemoteContext
 from humanfriendly.testing import TemporaryDirectory, TestCase, run_cli, touch
 from six.moves import configparser
+from update_dotdee import ConfigLoader
 
 # The module we're testing.
 from rotate_backups import (
+    Location,
     RotateBackups,
     coerce_location,
     coerce_retention_period,
+    compile_filename_patterns,
+    create_config_loader,
     load_config_file,
+    load_config_sections,
 )
 from rotate_backups.cli import main
 
-# Initialize a logger for this module.
-logger = logging.getLogger(__name__)
 
-SAMPLE_BACKUP_SET = set([
+SAMPLE_BACKUP_SET = frozenset([
     '2013-10-10@20:07', '2013-10-11@20:06', '2013-10-12@20:06', '2013-10-13@20:07', '2013-10-14@20:06',
     '2013-10-15@20:06', '2013-10-16@20:06', '2013-10-17@20:07', '2013-10-18@20:06', '2013-10-19@20:06',
     '2013-10-20@20:05', '2013-10-21@20:07', '2013-10-22@20:06', '2013-10-23@20:06', '2013-10-24@20:06',
@@ -87,6 +91,9 @@ SAMPLE_BACKUP_SET = set([
     '2014-07-02@20:03', 'some-random-directory',
 ])
 
+RUNNING_AS_ROOT = hasattr(os, 'getuid') and os.getuid() == 0
+"""Whether the test suite is running with superuser privileges (a boolean)."""
+
 
 class RotateBackupsTestCase(TestCase):
 
@@ -105,6 +112,10 @@ class RotateBackupsTestCase(TestCase):
         assert coerce_retention_period(42) == 42
         assert coerce_retention_period('42') == 42
         assert coerce_retention_period('21 * 2') == 42
+        # Check that repeated coercions give the same results.
+        assert coerce_retention_period('21 * 2') == 42
+        assert coerce_retention_period('Always') == 'always'
+        self.assertRaises(ValueError, coerce_retention_period, 'None')
 
     def test_location_coercion(self):
         """Test coercion of locations."""
@@ -114,6 +125,31 @@ class RotateBackupsTestCase(TestCase):
         location = coerce_location('some-host:/some/directory')
         assert isinstance(location.context, RemoteContext)
         assert location.directory == '/some/directory'
+        # Test that SSH connection sharing is opt-in.
+        assert 'ssh_command' not in location.context.options
+        location = coerce_location('some-host:/some/directory', ssh_multiplexing=True)
+        assert 'ControlMaster=auto' in location.context.options['ssh_command']
+        assert any(o.endswith('/cm-%C') for o in location.context.options['ssh_command'])
+        assert 'ssh_multiplexing' not in location.context.options
+        # Test that only local locations without sudo are accessed in-process.
+        assert not location.direct_access
+        assert coerce_location('/some/directory').direct_access
+        assert not coerce_location('/some/directory', sudo=True).direct_access
+
+    def test_filename_pattern_union(self):
+        """Test that filename patterns are combined correctly."""
+        assert compile_filename_patterns([]) is None
+        match = compile_filename_patterns(['2014-*', '*-extra'])
+        assert match('2014-01-01')
+        assert match('2015-01-01-extra')
+        assert not match('2015-01-01')
+        # Case sensitivity follows fnmatch.fnmatch().
+        assert bool(match('2015-01-01-EXTRA')) == fnmatch.fnmatch('2015-01-01-EXTRA', '*-extra')
+        # Patterns with different flags are matched one by one.
+        match = compile_filename_patterns(['2014-*', re.compile('.*-EXTRA', re.IGNORECASE)])
+        assert match('2014-01-01')
+        assert match('2015-01-01-extra')
+        assert not match('2015-01-01')
 
     def test_argument_validation(self):
         """Test argument validation."""
@@ -138,7 +174,7 @@ class RotateBackupsTestCase(TestCase):
             self.create_sample_backup_set(root)
             self.assertRaises(ValueError, lambda: RotateBackups(rotation_scheme={}).rotate_backups(root))
         # Argument validation tests that assume the current user isn't root.
-        if os.getuid() != 0:
+        if not RUNNING_AS_ROOT:
             # I'm being lazy and will assume that this test suite will only be
             # run on systems where users other than root do not have access to
             # /root.
@@ -169,6 +205,9 @@ class RotateBackupsTestCase(TestCase):
             )
             backups_that_were_preserved = set(os.listdir(root))
             assert backups_that_were_preserved == SAMPLE_BACKUP_SET
+            # Test that the command line arguments can be passed explicitly.
+            main(['--dry-run', '--daily=7', root])
+            assert set(os.listdir(root)) == SAMPLE_BACKUP_SET
 
     def test_rotate_backups(self):
         """Test the :func:`.rotate_backups()` function."""
@@ -176,7 +215,7 @@ class RotateBackupsTestCase(TestCase):
         # I've noted which rotation scheme it falls in and the number of
         # preserved backups within that rotation scheme (counting up as we
         # progress through the backups sorted by date).
-        expected_to_be_preserved = set([
+        expected_to_be_preserved = {
             '2013-10-10@20:07',  # monthly (1), yearly (1)
             '2013-11-01@20:06',  # monthly (2)
             '2013-12-01@20:07',  # monthly (3)
@@ -198,7 +237,7 @@ class RotateBackupsTestCase(TestCase):
             '2014-07-02@20:03',  # hourly (1), daily (7)
             'some-random-directory',  # no recognizable time stamp, should definitely be preserved
             'rotate-backups.ini',  # no recognizable time stamp, should definitely be preserved
-        ])
+        }
         with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
             # Specify the rotation scheme and options through a configuration file.
             config_file = os.path.join(root, 'rotate-backups.ini')
@@ -221,7 +260,7 @@ class RotateBackupsTestCase(TestCase):
         """Test the :func:`.rotate_concurrent()` function."""
         # These are the backups expected to be preserved
         # (the same as in test_rotate_backups).
-        expected_to_be_preserved = set([
+        expected_to_be_preserved = {
             '2013-10-10@20:07',  # monthly, yearly (1)
             '2013-11-01@20:06',  # monthly (2)
             '2013-12-01@20:07',  # monthly (3)
@@ -242,7 +281,7 @@ class RotateBackupsTestCase(TestCase):
             '2014-07-01@20:02',  # daily (6), monthly (10)
             '2014-07-02@20:03',  # hourly (1), daily (7)
             'some-random-directory',  # no recognizable time stamp, should definitely be preserved
-        ])
+        }
         with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
             self.create_sample_backup_set(root)
             run_cli(
@@ -251,13 +290,61 @@ class RotateBackupsTestCase(TestCase):
             )
             backups_that_were_preserved = set(os.listdir(root))
             assert backups_that_were_preserved == expected_to_be_preserved
+        # Test that locations without backups don't break concurrent rotation.
+        with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
+            RotateBackups(rotation_scheme=dict(daily=7)).rotate_concurrent(root)
+        # Test that --workers limits the concurrency of --parallel.
+        with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
+            os.mkdir(os.path.join(root, 'backup-2016-01-10_21-15-00'))
+            os.mkdir(os.path.join(root, 'backup-2016-01-10_21-30-00'))
+            returncode, output = run_cli(main, '--hourly=1', '--parallel', '--workers=1', root)
+            assert returncode == 0
+            assert os.listdir(root) == ['backup-2016-01-10_21-15-00']
+        # Test that a failed removal doesn't stop the rotation of other locations.
+        with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
+            locations = [os.path.join(root, name) for name in ('failing', 'laptop', 'vps')]
+            for location in locations:
+                os.mkdir(location)
+                os.mkdir(os.path.join(location, 'backup-2016-01-10_21-15-00'))
+                os.mkdir(os.path.join(location, 'backup-2016-01-10_21-30-00'))
+            program = RotateBackups(
+                rotation_scheme=dict(hourly=1),
+                removal_command=['sh', '-c', 'case "$1" in */failing/*) exit 1;; esac; exec rm -fR "$1"', 'remove'],
+            )
+            self.assertRaises(CommandPoolFailed, program.rotate_concurrent, *locations)
+            for location in locations:
+                expected = 2 if location.endswith('failing') else 1
+                assert len(os.listdir(location)) == expected
+
+    def test_workers(self):
+        """Test that multiple locations can be rotated by multiple workers."""
+        with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
+            locations = [os.path.join(root, name) for name in ('laptop', 'vps')]
+            for location in locations:
+                os.mkdir(location)
+                os.mkdir(os.path.join(location, 'backup-2016-01-10_21-15-00'))
+                os.mkdir(os.path.join(location, 'backup-2016-01-10_21-30-00'))
+            # Duplicate arguments are rotated only once.
+            returncode, output = run_cli(main, '--hourly=1', '--workers=2', *(locations + locations))
+            assert returncode == 0
+            for location in locations:
+                assert os.listdir(location) == ['backup-2016-01-10_21-15-00']
+            # Test that a failing location doesn't abort the other locations.
+            os.mkdir(os.path.join(locations[0], 'backup-2016-01-10_21-45-00'))
+            returncode, output = run_cli(main, '--hourly=1', '--workers=2',
+                                         os.path.join(root, 'does-not-exist'), locations[0])
+            assert returncode != 0
+            assert os.listdir(locations[0]) == ['backup-2016-01-10_21-15-00']
+        # Test that an invalid number of workers causes an error to be reported.
+        returncode, output = run_cli(main, '--workers=0')
+        assert returncode != 0
 
     def test_include_list(self):
         """Test include list logic."""
         # These are the backups expected to be preserved within the year 2014
         # (other years are excluded and so should all be preserved, see below).
         # After each backup I've noted which rotation scheme it falls in.
-        expected_to_be_preserved = set([
+        expected_to_be_preserved = {
             '2014-01-01@20:07',  # monthly, yearly
             '2014-02-01@20:05',  # monthly
             '2014-03-01@20:04',  # monthly
@@ -275,10 +362,8 @@ class RotateBackupsTestCase(TestCase):
             '2014-07-01@20:02',  # daily, monthly
             '2014-07-02@20:03',  # hourly, daily
             'some-random-directory',  # no recognizable time stamp, should definitely be preserved
-        ])
-        for name in SAMPLE_BACKUP_SET:
-            if not name.startswith('2014-'):
-                expected_to_be_preserved.add(name)
+        }
+        expected_to_be_preserved.update(n for n in SAMPLE_BACKUP_SET if not n.startswith('2014-'))
         with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
             self.create_sample_backup_set(root)
             run_cli(
@@ -295,7 +380,7 @@ class RotateBackupsTestCase(TestCase):
         # I've noted which rotation scheme it falls in and the number of
         # preserved backups within that rotation scheme (counting up as we
         # progress through the backups sorted by date).
-        expected_to_be_preserved = set([
+        expected_to_be_preserved = {
             '2013-10-10@20:07',  # monthly (1), yearly (1)
             '2013-11-01@20:06',  # monthly (2)
             '2013-12-01@20:07',  # monthly (3)
@@ -318,10 +403,8 @@ class RotateBackupsTestCase(TestCase):
             '2014-07-01@20:02',  # daily (6), monthly (10)
             '2014-07-02@20:03',  # hourly (1), daily (7)
             'some-random-directory',  # no recognizable time stamp, should definitely be preserved
-        ])
-        for name in SAMPLE_BACKUP_SET:
-            if name.startswith('2014-05-'):
-                expected_to_be_preserved.add(name)
+        }
+        expected_to_be_preserved.update(n for n in SAMPLE_BACKUP_SET if n.startswith('2014-05-'))
         with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
             self.create_sample_backup_set(root)
             run_cli(
@@ -390,13 +473,25 @@ class RotateBackupsTestCase(TestCase):
     def test_removal_command(self):
         """Test that the removal command can be customized."""
         with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
-            today = datetime.datetime.now()
-            for date in today, (today - datetime.timedelta(hours=24)):
-                os.mkdir(os.path.join(root, date.strftime('%Y-%m-%d')))
+            for date in '2019-03-05', '2019-03-06':
+                os.mkdir(os.path.join(root, date))
             program = RotateBackups(removal_command=['rmdir'], rotation_scheme=dict(monthly='always'))
             commands = program.rotate_backups(root, prepare=True)
             assert any(cmd.command_line[0] == 'rmdir' for cmd in commands)
 
+    def test_removal_batching(self):
+        """Test that the default removal command removes backups in batches."""
+        with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
+            for date in '2019-03-05', '2019-03-06', '2019-03-07':
+                os.mkdir(os.path.join(root, date))
+            program = RotateBackups(rotation_scheme=dict(monthly=1))
+            commands = program.rotate_backups(root, prepare=True)
+            assert len(commands) == 1
+            assert commands[0].command_line[-2:] == [
+                os.path.join(root, '2019-03-06'),
+                os.path.join(root, '2019-03-07'),
+            ]
+
     def test_force(self):
         """Test that sanity checks can be overridden."""
         with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
@@ -406,6 +501,18 @@ class RotateBackupsTestCase(TestCase):
                 program = RotateBackups(force=True, rotation_scheme=dict(monthly='always'))
                 self.assertRaises(ExternalCommandFailed, program.rotate_backups, root)
 
+    def test_access_checks(self):
+        """Test that the sanity checks on locations are computed correctly."""
+        with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
+            assert coerce_location(root).access_checks == (True, True, True)
+            missing = coerce_location(os.path.join(root, 'does-not-exist'))
+            assert missing.access_checks == (False, False, False)
+            # Test the shell command used when the directory can't be accessed in-process.
+            context = coerce_location(root).context
+            assert ShellLocation(context=context, directory=root).access_checks == (True, True, True)
+            missing = ShellLocation(context=context, directory=os.path.join(root, 'does-not-exist'))
+            assert missing.access_checks == (False, False, False)
+
     def test_ensure_writable(self):
         """Test that ensure_writable() complains when the location isn't writable."""
         with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
@@ -455,6 +562,143 @@ class RotateBackupsTestCase(TestCase):
             assert any(location.directory == os.path.join(root, 'laptop') for location in available_locations)
             assert any(location.directory == os.path.join(root, 'vps') for location in available_locations)
 
+    def test_config_section_precedence(self):
+        """Test that the first matching configuration file section is used."""
+        with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
+            config_file = os.path.join(root, 'rotate-backups.ini')
+            parser = configparser.RawConfigParser()
+            sections = [
+                # A filename pattern that sorts before a literal section.
+                (os.path.join(root, 'a', '*'), '1'),
+                (os.path.join(root, 'a', 'laptop'), '2'),
+                # A literal section that sorts before a filename pattern.
+                (os.path.join(root, 'b', 'VPS'), '3'),
+                (os.path.join(root, 'b', 'VPS*'), '4'),
+                # A remote location.
+                ('remote-host:' + os.path.join(root, 'c'), '5'),
+            ]
+            for section, daily in sections:
+                parser.add_section(section)
+                parser.set(section, 'daily', daily)
+            with open(config_file, 'w') as handle:
+                parser.write(handle)
+            default_scheme = dict(monthly='always')
+
+            def get_scheme(location):
+                program = RotateBackups(config_file=config_file, rotation_scheme=default_scheme)
+                program.load_config_file(location)
+                return program.rotation_scheme
+
+            assert get_scheme(os.path.join(root, 'a', 'laptop')) == dict(daily=1)
+            assert get_scheme(os.path.join(root, 'b', 'VPS')) == dict(daily=3)
+            assert get_scheme(os.path.join(root, 'b', 'VPS-old')) == dict(daily=4)
+            # Check that pathnames are normalized before they are matched.
+            assert get_scheme(os.path.join(root, 'b', 'VPS') + '/') == dict(daily=3)
+            assert get_scheme(os.path.join(root, 'b', '.', 'VPS')) == dict(daily=3)
+            assert get_scheme('remote-host:' + os.path.join(root, 'c') + '/') == dict(daily=5)
+            # Check that locations on other systems don't match.
+            assert get_scheme(os.path.join(root, 'c')) == default_scheme
+            assert get_scheme('other-host:' + os.path.join(root, 'c')) == default_scheme
+            assert get_scheme('remote-host:' + os.path.join(root, 'b', 'VPS')) == default_scheme
+
+    def test_config_file_cache(self):
+        """Test that parsed configuration files are cached until they change."""
+        with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
+            config_file = os.path.join(root, 'rotate-backups.ini')
+            for daily in '7', '14':
+                parser = configparser.RawConfigParser()
+                parser.add_section(root)
+                parser.set(root, 'daily', daily)
+                with open(config_file, 'w') as handle:
+                    parser.write(handle)
+                # Check that changes to the configuration file are picked up.
+                location, rotation_scheme, options = next(load_config_file(config_file))
+                assert rotation_scheme == dict(daily=int(daily))
+                # Check that unchanged configuration files are not parsed again.
+                loader = create_config_loader(config_file)
+                assert load_config_sections(loader) is load_config_sections(loader)
+
+    def test_config_file_cache_invalidation(self):
+        """Test that changes to configuration files that are hard to detect invalidate the cache."""
+        with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
+            config_file = os.path.join(root, 'rotate-backups.ini')
+
+            def load():
+                return load_config_sections(ConfigLoader(available_files=[config_file], strict=False))
+
+            with open(config_file, 'w') as handle:
+                handle.write('[%s]\ndaily = 7\n' % root)
+            # Check that an edit within the same second is picked up.
+            if hasattr(os.stat(config_file), 'st_mtime_ns'):
+                os.utime(config_file, ns=(10 ** 18, 10 ** 18))
+                assert load()[0][0][1]['daily'] == '7'
+                with open(config_file, 'w') as handle:
+                    handle.write('[%s]\ndaily = 8\n' % root)
+                os.utime(config_file, ns=(10 ** 18 + 1, 10 ** 18 + 1))
+                assert load()[0][0][1]['daily'] == '8'
+            # Check that a change of permissions is picked up.
+            os.chmod(config_file, 0o644)
+            result = load()
+            os.chmod(config_file, 0o600)
+            assert load() is not result
+            # Check that unreadable configuration files are loaded once they become readable.
+            if not RUNNING_AS_ROOT:
+                os.chmod(config_file, 0)
+                assert load()[0] == []
+                os.chmod(config_file, 0o644)
+                assert load()[0][0][0] == root
+
+    def test_config_file_cache_isolation(self):
+        """Test that callers can't observe or modify each other's configuration objects."""
+        with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
+            directory = os.path.join(root, 'backups')
+            config_file = os.path.join(root, 'rotate-backups.ini')
+            parser = configparser.RawConfigParser()
+            parser.add_section(directory)
+            parser.set(directory, 'daily', '7')
+            parser.set(directory, 'include-list', '*.tar')
+            with open(config_file, 'w') as handle:
+                parser.write(handle)
+            program = RotateBackups(rotation_scheme=dict(daily=7))
+            # Check that a failing sanity check isn't remembered.
+            location, rotation_scheme, options = next(load_config_file(config_file))
+            self.assertRaises(ValueError, program.rotate_backups, location, load_config=False)
+            os.mkdir(directory)
+            location, rotation_scheme, options = next(load_config_file(config_file))
+            assert program.rotate_backups(location, load_config=False) == []
+            # Check that modifications by callers don't affect later callers.
+            rotation_scheme['daily'] = 1
+            options['include_list'].append('*.zip')
+            location, rotation_scheme, options = next(load_config_file(config_file))
+            assert rotation_scheme == dict(daily=7)
+            assert options['include_list'] == ['*.tar']
+
+    def test_config_ssh_multiplexing(self):
+        """Test that SSH connection sharing applies to configured locations."""
+        with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
+            config_file = os.path.join(root, 'rotate-backups.ini')
+            parser = configparser.RawConfigParser()
+            parser.add_section('host-a:/backups')
+            parser.set('host-a:/backups', 'daily', '7')
+            parser.add_section('host-b:/backups')
+            parser.set('host-b:/backups', 'daily', '7')
+            parser.set('host-b:/backups', 'ssh-multiplexing', 'no')
+            with open(config_file, 'w') as handle:
+                parser.write(handle)
+            # Check that the default applies to sections that don't override it.
+            locations = dict(
+                (location.ssh_alias, location) for location, _, _ in
+                load_config_file(config_file, expand=False, ssh_multiplexing=True)
+            )
+            assert 'ControlMaster=auto' in locations['host-a'].context.options['ssh_command']
+            assert 'ssh_command' not in locations['host-b'].context.options
+            # Check that a given location that matches a section keeps sharing connections.
+            program = RotateBackups(rotation_scheme=dict(daily=1), config_file=config_file)
+            location = program.load_config_file(coerce_location('host-a:/backups/', ssh_multiplexing=True))
+            assert 'ControlMaster=auto' in location.context.options['ssh_command']
+            location = program.load_config_file(coerce_location('host-a:/backups'))
+            assert 'ssh_command' not in location.context.options
+
     def test_custom_timestamp_pattern(self):
         """Test that custom timestamp patterns are properly supported."""
         with TemporaryDirectory(prefix='rotate-backups-', suffix='-test-suite') as root:
@@ -507,9 +751,18 @@ class RotateBackupsTestCase(TestCase):
             os.mkdir(os.path.join(root, name))
 
 
+class ShellLocation(Location):
+
+    """:class:`.Location` subclass that never accesses its directory in-process."""
+
+    direct_access = False
+
+
 @contextlib.contextmanager
 def readonly_directory(pathname):
     """Context manager to temporarily make something read only."""
     os.chmod(pathname, 0o555)
-    yield
-    os.chmod(pathname, 0o775)
+    try:
+        yield
+    finally:
+        os.chmod(pathname, 0o775)
@@ -20,25 +20,38 @@ Setup script for the ``rotate-backups`` package.
 """
 
 # Standard library modules.
-import codecs
+import io
 import os
 import re
 
 # De-facto standard solution for Python packaging.
 from setuptools import find_packages, setup
 
+# Regular expressions used to extract metadata from source files.
+VERSION_PATTERN = re.compile('__version__ = [\'"]([^\'"]+)')
+COMMENT_PATTERN = re.compile(r'^#.*|\s#.*')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# The directory containing the source distribution.
+SOURCE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
 
 def get_contents(*args):
     """Get the contents of a file relative to the source distribution directory."""
-    with codecs.open(get_absolute_path(*args), 'r', 'UTF-8') as handle:
+    with io.open(get_absolute_path(*args), encoding='UTF-8') as handle:
         return handle.read()
 
 
 def get_version(*args):
     """Extract the version number from a Python module."""
-    contents = get_contents(*args)
-    metadata = dict(re.findall('__([a-z]+)__ = [\'"]([^\'"]+)', contents))
-    return metadata['version']
+    with io.open(get_absolute_path(*args), encoding='UTF-8') as handle:
+        for line in handle:
+            # Only lines that define the version number need to be matched.
+            if line.startswith('__version__'):
+                match = VERSION_PATTERN.match(line)
+                if match:
+                    return match.group(1)
+    raise ValueError("Failed to extract version number from %s!" % os.path.join(*args))
 
 
 def get_requirements(*args):
@@ -47,16 +60,16 @@ def get_requirements(*args):
     with open(get_absolute_path(*args)) as handle:
         for line in handle:
             # Strip comments.
-            line = re.sub(r'^#.*|\s#.*', '', line)
+            line = COMMENT_PATTERN.sub('', line)
             # Ignore empty lines
             if line and not line.isspace():
-                requirements.add(re.sub(r'\s+', '', line))
+                requirements.add(WHITESPACE_PATTERN.sub('', line))
     return sorted(requirements)
 
 
 def get_absolute_path(*args):
     """Transform relative pathnames into absolute pathnames."""
-    return os.path.join(os.path.dirname(os.path.abspath(__file__)), *args)
+    return os.path.join(SOURCE_DIRECTORY, *args)
 
 
 setup(name="rotate-backups",